@@ -1,11 +1,15 @@
 import os
+import functools
 import io
 import json
 import hashlib
 import logging
+import threading
 import time
 import uuid
 import re
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict, Any, Optional
 from flask import Flask, request, jsonify
 from flask_cors import CORS
@@ -14,6 +18,13 @@ from dotenv import load_dotenv
 app = Flask(__name__)
 CORS(app)
 
+# Cap request size so oversized submissions are rejected up front instead of
+# being spooled and parsed; werkzeug streams bodies above its in-memory
+# threshold to temp files, so accepted uploads never multiply RAM by client
+# count before this check
+MAX_UPLOAD_MB = int(os.environ.get("MAX_UPLOAD_MB", "50"))
+app.config["MAX_CONTENT_LENGTH"] = MAX_UPLOAD_MB * 1024 * 1024
+
 # Model selection for OpenAI (default to GPT-5 unless overridden)
 # Load .env from the backend directory before reading environment variables
 try:
@@ -24,11 +35,87 @@ except Exception:
 
 # External dependencies (installed via requirements.txt)
 from openai import OpenAI  # OpenAI SDK
-import openpyxl  # XLSX parsing
-from pypdf import PdfReader  # PDF text extraction
+import ahocorasick  # multi-pattern text search for provenance
+import orjson  # fast JSON serialization on hot paths
+from python_calamine import CalamineWorkbook  # fast Rust-based XLSX parsing
+import pymupdf  # PDF text extraction (MuPDF C core; much faster than pure-Python parsers)
+
+# Simple in-memory cache to avoid duplicate LLM calls for identical inputs.
+# Guarded by a lock because attachment parsing runs on worker threads and the
+# app may be served by a threaded WSGI server; bounded with LRU eviction so a
+# long-running server does not grow it without limit.
+LLM_CACHE: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (inserted_at, result)
+LLM_CACHE_LOCK = threading.Lock()
+LLM_CACHE_MAX_ENTRIES = int(os.environ.get("LLM_CACHE_MAX_ENTRIES", "1024"))
+# Entries older than this are treated as misses; 0 disables expiry
+LLM_CACHE_TTL_SECONDS = float(os.environ.get("LLM_CACHE_TTL_SECONDS", "3600"))
+
+
+def _llm_cache_get(cache_key: str) -> Optional[Dict[str, Any]]:
+    with LLM_CACHE_LOCK:
+        entry = LLM_CACHE.get(cache_key)
+        if entry is None:
+            return None
+        inserted_at, result = entry
+        if LLM_CACHE_TTL_SECONDS > 0 and time.time() - inserted_at > LLM_CACHE_TTL_SECONDS:
+            del LLM_CACHE[cache_key]
+            return None
+        LLM_CACHE.move_to_end(cache_key)
+        return result
 
-# Simple in-memory cache to avoid duplicate LLM calls for identical inputs
-LLM_CACHE: Dict[str, Dict[str, Any]] = {}
+
+def _llm_cache_set(cache_key: str, result: Dict[str, Any]) -> None:
+    with LLM_CACHE_LOCK:
+        LLM_CACHE[cache_key] = (time.time(), result)
+        LLM_CACHE.move_to_end(cache_key)
+        while len(LLM_CACHE) > LLM_CACHE_MAX_ENTRIES:
+            LLM_CACHE.popitem(last=False)
+
+# On-disk LLM cache shared across workers and restarts; content-addressed by
+# the same cache key as LLM_CACHE. Set LLM_CACHE_DIR="" to disable.
+LLM_CACHE_DIR = os.environ.get(
+    "LLM_CACHE_DIR", os.path.join(os.path.dirname(__file__), ".llm_cache")
+)
+
+# Optional semantic cache: the exact-hash cache misses on trivial edits
+# (whitespace, forwarded-by banners, signature tweaks) even though the
+# extracted fields are identical. When enabled, near-duplicate email threads
+# are matched by embedding similarity. Opt-in because it costs one extra
+# embeddings API call per request.
+SEMANTIC_CACHE_ENABLED = os.environ.get("LLM_SEMANTIC_CACHE", "false").strip().lower() in ("true", "1", "yes", "on")
+SEMANTIC_CACHE_THRESHOLD = float(os.environ.get("LLM_SEMANTIC_CACHE_THRESHOLD", "0.97"))
+SEMANTIC_CACHE_EMBED_MODEL = os.environ.get("LLM_SEMANTIC_CACHE_EMBED_MODEL", "text-embedding-3-small")
+_SEMANTIC_CACHE: List[Dict[str, Any]] = []  # entries: {"vector", "signature", "result"}
+_SEMANTIC_CACHE_LOCK = threading.Lock()
+_SEMANTIC_CACHE_MAX = 256
+
+_WS_RE = re.compile(r"\s+")
+
+# Shared OpenAI client: reuses the underlying httpx connection pool (TCP+TLS
+# keep-alive) across requests instead of paying a fresh handshake per call.
+# OpenAI and httpx.Client are both thread-safe.
+_OPENAI_CLIENT: Optional["OpenAI"] = None
+_OPENAI_CLIENT_LOCK = threading.Lock()
+
+
+def _openai_client() -> "OpenAI":
+    global _OPENAI_CLIENT
+    if _OPENAI_CLIENT is None:
+        with _OPENAI_CLIENT_LOCK:
+            if _OPENAI_CLIENT is None:
+                _OPENAI_CLIENT = OpenAI()
+    return _OPENAI_CLIENT
+
+# Upper bound on threads used to parse attachments concurrently per request
+MAX_PARSE_WORKERS = 8
+
+# Cap on email thread text sent to the LLM; beyond this the schema fields are
+# long since established and extra tokens only add latency and cost
+MAX_EMAIL_CHARS = 20_000
+
+# Deployments that fully trust LLM citations can turn the document-search
+# provenance fallback off entirely
+PROVENANCE_ENABLED = os.environ.get("RESIQUANT_PROVENANCE", "1").strip() == "1"
 
 
 # --- Logging setup -----------------------------------------------------------
@@ -39,23 +126,109 @@ logger = logging.getLogger("resiquant")
 
 
 def _now_ms() -> int:
-    return int(time.time() * 1000)
+    # Monotonic so latency math is immune to NTP clock jumps; only ever used
+    # for relative measurements
+    return time.monotonic_ns() // 1_000_000
 
 
 def _json_log(level: str, payload: Dict[str, Any]) -> None:
     lvl = getattr(logging, level.upper(), logging.INFO)
     # Ensure minimal, structured JSON without secrets/PII
     try:
-        logger.log(lvl, json.dumps(payload, ensure_ascii=False))
+        logger.log(lvl, orjson.dumps(payload).decode())
     except Exception:
         # Best-effort logging fallback
         logger.log(lvl, str(payload))
 
 
 def _hash_string(s: str) -> str:
+    # SHA-256 on purpose: broker_email_hash must stay stable across deploys
+    # for log correlation, unlike the process-local cache/source hashes
     return hashlib.sha256(s.encode("utf-8")).hexdigest()
 
 
+def _llm_disk_cache_get(cache_key: str) -> Optional[Dict[str, Any]]:
+    if not LLM_CACHE_DIR:
+        return None
+    try:
+        with open(os.path.join(LLM_CACHE_DIR, f"{cache_key}.json"), "rb") as f:
+            return orjson.loads(f.read())
+    except Exception:
+        return None
+
+
+def _llm_disk_cache_set(cache_key: str, result: Dict[str, Any]) -> None:
+    if not LLM_CACHE_DIR:
+        return
+    try:
+        os.makedirs(LLM_CACHE_DIR, exist_ok=True)
+        path = os.path.join(LLM_CACHE_DIR, f"{cache_key}.json")
+        tmp = f"{path}.tmp-{uuid.uuid4().hex}"
+        with open(tmp, "wb") as f:
+            f.write(orjson.dumps(result))
+        os.replace(tmp, path)  # atomic publish so readers never see partial JSON
+    except Exception:
+        pass
+
+
+def _normalize_email_text(text: str) -> str:
+    # Collapse whitespace and case so cosmetic edits embed to nearby vectors
+    return _WS_RE.sub(" ", (text or "").strip().lower())
+
+
+def _embed_email_text(client: "OpenAI", text: str) -> Optional[List[float]]:
+    """Return a unit-normalized embedding of the email text, or None on failure."""
+    try:
+        resp = client.embeddings.create(
+            model=SEMANTIC_CACHE_EMBED_MODEL,
+            input=_normalize_email_text(text)[:8000],
+        )
+        vec = resp.data[0].embedding
+        norm = sum(v * v for v in vec) ** 0.5
+        if not norm:
+            return None
+        return [v / norm for v in vec]
+    except Exception:
+        return None
+
+
+def _semantic_cache_lookup(vector: List[float], signature: str) -> Optional[Dict[str, Any]]:
+    """Return the cached result whose embedding is nearest to `vector`, if close enough.
+
+    Only entries with a matching signature (attachments + model + guess_mode)
+    are eligible; cosine similarity must meet SEMANTIC_CACHE_THRESHOLD.
+    """
+    best: Optional[Dict[str, Any]] = None
+    best_sim = SEMANTIC_CACHE_THRESHOLD
+    with _SEMANTIC_CACHE_LOCK:
+        entries = [e for e in _SEMANTIC_CACHE if e["signature"] == signature]
+    for e in entries:
+        sim = sum(a * b for a, b in zip(vector, e["vector"]))
+        if sim >= best_sim:
+            best_sim = sim
+            best = e["result"]
+    return best
+
+
+def _semantic_cache_store(vector: List[float], signature: str, result: Dict[str, Any]) -> None:
+    with _SEMANTIC_CACHE_LOCK:
+        if len(_SEMANTIC_CACHE) >= _SEMANTIC_CACHE_MAX:
+            _SEMANTIC_CACHE.pop(0)
+        _SEMANTIC_CACHE.append({"vector": vector, "signature": signature, "result": result})
+
+
+@functools.lru_cache(maxsize=1)
+def _openai_prices() -> "tuple[Optional[float], Optional[float]]":
+    """Read token prices from the environment once per process."""
+    try:
+        return (
+            float(os.environ.get("OPENAI_PRICE_INPUT_PER_1K", "")),
+            float(os.environ.get("OPENAI_PRICE_OUTPUT_PER_1K", "")),
+        )
+    except Exception:
+        return (None, None)
+
+
 def compute_cost_from_usage(usage: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
     """Compute cost in USD given a usage dict with prompt/completion tokens.
 
@@ -64,17 +237,13 @@ def compute_cost_from_usage(usage: Optional[Dict[str, Any]]) -> Optional[Dict[st
     """
     if not usage or not isinstance(usage, dict):
         return None
+    price_in, price_out = _openai_prices()
+    if price_in is None or price_out is None:
+        return None
     pt = usage.get("prompt_tokens") or 0
     ct = usage.get("completion_tokens") or 0
-    try:
-        price_in = float(os.environ.get("OPENAI_PRICE_INPUT_PER_1K", ""))
-        price_out = float(os.environ.get("OPENAI_PRICE_OUTPUT_PER_1K", ""))
-    except Exception:
-        return None
-    if not isinstance(price_in, (int, float)) or not isinstance(price_out, (int, float)):
-        return None
-    input_cost = (float(pt) / 1000.0) * float(price_in)
-    output_cost = (float(ct) / 1000.0) * float(price_out)
+    input_cost = (pt / 1000.0) * price_in
+    output_cost = (ct / 1000.0) * price_out
     total_cost = input_cost + output_cost
     return {
         "currency": "USD",
@@ -86,59 +255,149 @@ def compute_cost_from_usage(usage: Optional[Dict[str, Any]]) -> Optional[Dict[st
 
 EMAIL_RE = re.compile(r"[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}")
 
+# Salvage pattern for LLM replies that wrap the JSON object in extra text
+_JSON_OBJ_RE = re.compile(r"\{.*\}", re.DOTALL)
+
+
+def _is_gpt5_model(model: str) -> bool:
+    # gpt-5 models reject non-default temperature
+    return model.lower().startswith("gpt-5")
+
 
 def redact_emails(text: str) -> str:
     # Replace emails with a generic token; avoid logging raw PII
     return EMAIL_RE.sub("[REDACTED_EMAIL]", text or "")
 
 
-def extract_text_from_pdf(file_stream: io.BytesIO) -> str:
+def extract_text_from_pdf(data: bytes, max_chars: Optional[int] = None) -> str:
+    """Extract page text from a PDF, stopping once max_chars is reached.
+
+    Callers that only need a preview pass max_chars so long documents are
+    not parsed past the amount of text actually consumed.
+    """
     try:
-        reader = PdfReader(file_stream)
-        texts = []
-        for page in reader.pages:
-            try:
-                texts.append(page.extract_text() or "")
-            except Exception:
-                continue
-        return "\n".join(texts).strip()
+        with pymupdf.open(stream=data, filetype="pdf") as doc:
+            texts = []
+            total = 0
+            for page in doc:
+                try:
+                    txt = page.get_text("text") or ""
+                except Exception:
+                    continue
+                texts.append(txt)
+                total += len(txt)
+                if max_chars is not None and total >= max_chars:
+                    break
+            return "\n".join(texts).strip()
     except Exception:
         return ""
 
 
-def extract_text_from_xlsx(data: bytes, max_cells: int = 2000) -> str:
+def _extract_text_from_xlsx_openpyxl(data: bytes, max_cells: int = 2000) -> str:
+    # Imported lazily: this path only runs for workbooks calamine rejects, so
+    # worker cold-start skips the openpyxl import entirely
+    import openpyxl
+
     try:
         # Load workbook from bytes
         bio = io.BytesIO(data)
-        wb = openpyxl.load_workbook(bio, data_only=True, read_only=True)
+        wb = openpyxl.load_workbook(bio, data_only=True, read_only=True, keep_links=False)
         lines = []
         count = 0
+        done = False
         for ws in wb.worksheets:
+            try:
+                # read_only mode trusts the declared sheet dimension, which is
+                # sometimes bogus (1M empty rows); recompute from actual cells
+                ws.reset_dimensions()
+            except Exception:
+                pass
             lines.append(f"# Sheet: {ws.title}")
             for row in ws.iter_rows(values_only=True):
                 if count >= max_cells:
+                    done = True
                     break
-                # Join non-empty cell values
-                vals = [str(v) for v in row if v is not None]
+                # Stop mid-row once the cell budget is spent so wide rows do
+                # not over-read past the cap
+                vals = []
+                for v in row:
+                    if v is None:
+                        continue
+                    vals.append(str(v))
+                    count += 1
+                    if count >= max_cells:
+                        break
                 if vals:
                     lines.append(", ".join(vals))
-                    count += len(vals)
-            if count >= max_cells:
+            if done:
                 break
         return "\n".join(lines).strip()
     except Exception:
         return ""
 
 
+def extract_text_from_xlsx(data: bytes, max_cells: int = 2000) -> str:
+    # python-calamine (Rust) parses XLSX far faster and with less memory than
+    # openpyxl's read_only mode. Keep openpyxl as a fallback for workbooks
+    # calamine rejects, or force it via XLSX_PARSER=openpyxl.
+    if os.environ.get("XLSX_PARSER", "").lower() != "openpyxl":
+        try:
+            wb = CalamineWorkbook.from_filelike(io.BytesIO(data))
+            lines = []
+            count = 0
+            for sheet_name in wb.sheet_names:
+                lines.append(f"# Sheet: {sheet_name}")
+                for row in wb.get_sheet_by_name(sheet_name).iter_rows():
+                    if count >= max_cells:
+                        break
+                    # calamine yields "" (not None) for empty cells
+                    vals = [str(v) for v in row if v is not None and v != ""]
+                    if vals:
+                        lines.append(", ".join(vals))
+                        count += len(vals)
+                if count >= max_cells:
+                    break
+            return "\n".join(lines).strip()
+        except Exception:
+            pass
+    return _extract_text_from_xlsx_openpyxl(data, max_cells=max_cells)
+
+
+# Cache of extracted text previews keyed by (content hash, extractor version)
+# so identical attachments re-uploaded across requests skip parsing entirely.
+# Bump the version strings when extractor behavior changes.
+_DOC_TEXT_CACHE: Dict[tuple, str] = {}
+_DOC_TEXT_CACHE_LOCK = threading.Lock()
+_DOC_TEXT_CACHE_MAX = 256
+
+
+def _cached_text_preview(data: bytes, version: str, extractor) -> str:
+    key = (hashlib.blake2b(data, digest_size=16).hexdigest(), version)
+    with _DOC_TEXT_CACHE_LOCK:
+        cached = _DOC_TEXT_CACHE.get(key)
+    if cached is not None:
+        return cached
+    text = extractor()
+    with _DOC_TEXT_CACHE_LOCK:
+        if len(_DOC_TEXT_CACHE) >= _DOC_TEXT_CACHE_MAX:
+            _DOC_TEXT_CACHE.clear()
+        _DOC_TEXT_CACHE[key] = text
+    return text
+
+
 def structure_document_json(filename: str, content_type: str, data: bytes) -> Dict[str, Any]:
     size = len(data)
     text_preview = ""
 
     if content_type.lower() in ("application/pdf",) or filename.lower().endswith(".pdf"):
-        text_preview = extract_text_from_pdf(io.BytesIO(data))[:2000]
+        text_preview = _cached_text_preview(
+            data, "pdf_v1", lambda: extract_text_from_pdf(data, max_chars=2000)[:2000]
+        )
     elif content_type.lower() in ("application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",) or filename.lower().endswith(".xlsx"):
         # Allow a longer preview for spreadsheets to capture full address tables
-        text_preview = extract_text_from_xlsx(data)[:8000]
+        text_preview = _cached_text_preview(
+            data, "xlsx_v1", lambda: extract_text_from_xlsx(data)[:8000]
+        )
     else:
         # naive text attempt for text-like files
         try:
@@ -177,82 +436,97 @@ def summarize_attachments_for_llm(attachments: List[Dict[str, Any]]) -> List[Dic
     return summaries
 
 
+# Prompt text is constant per guess_mode, so it is composed once at import.
+# Keeping the system prefix byte-identical across calls also lets OpenAI's
+# server-side prompt caching reuse the prefill for the (long) schema block;
+# only the user turn varies per request.
+
+_BASE_INSTRUCTIONS = (
+    "Extract brokerage details and property addresses from the provided email thread text and attachment summaries. "
+    "Always return strictly valid JSON that conforms to the schema. No extra text.\n\n"
+    "Domain Context: The auto-ingest of insurance submission documents is a process that automates the current "
+    "manual process of reading insurance email submissions (and attachments) to extract relevant building attributes "
+    "of the properties requesting coverage such as construction class, occupancy type, number of stories, and others. "
+    "These attributes are necessary for running a catastrophe model and providing a quote. Every insurance submission is different; "
+    "each broker has their own document format and property data is often sparse, unstandardized, and unvetted. \n\n"
+    "Attachments may include tables or spreadsheets. Treat comma- or tab-separated rows and multi-line cells as structured records. "
+)
+_STRICT_GUIDANCE = (
+    "Interpret fields semantically and prefer explicit mentions from the documents. "
+    "If information is missing entirely, return null rather than guessing.\n\n"
+)
+_INFER_GUIDANCE = (
+    "Interpret fields semantically and prefer explicit mentions. "
+    "If information appears implied but not explicitly stated, you may infer from context, "
+    "but reduce confidence and explain the inference clearly.\n\n"
+)
+
+_RULES_COMMON = (
+    "Rules:\n"
+    "- Use the email thread text and all attachment summaries\n"
+    "- Citations must be snippets that include the exact matched text plus surrounding context (120 characters on each side) from the provided texts (email thread or attachment previews).\n"
+    "- The \"source\" must be either \"email_pdf\" or the exact attachment filename provided.\n"
+    "- \"property_addresses\" must be a list of ALL property addresses found across the email and attachments.\n"
+    "- For each field, set \"field_confidence\" with a numeric score and a concise explanation for the score.\n"
+    "- In citations, set \"match\" equal to the exact text you used to identify the field (e.g., the broker name or address).\n"
+)
+_RULES_STRICT = "- If a field is not present explicitly, return null (and an empty citation list).\n"
+_RULES_INFER = (
+    "- If a field is not present explicitly, you may infer from context; "
+    "provide citations to the closest evidence, set a lower confidence, and explain the uncertainty.\n"
+)
+_SCHEMA_BODY = (
+    "Return a JSON object with exactly these fields and types:\n"
+    "{\n"
+    "  \"broker_name\": string|null,\n"
+    "  \"broker_email\": string|null,\n"
+    "  \"brokerage\": string|null,\n"
+    "  \"complete_brokerage_address\": string|null,\n"
+    "  \"property_addresses\": [string],\n"
+    "  \"confidence_overall\": number,\n"
+    "  \"citations\": {\n"
+    "    // For each field above, provide an array of citations with source and a contextual snippet, plus the exact matched text\n"
+    "    \"broker_name\": [ { \"source\": \"email_pdf\"|string, \"snippet\": string, \"match\": string } ],\n"
+    "    \"broker_email\": [ { \"source\": \"email_pdf\"|string, \"snippet\": string, \"match\": string } ],\n"
+    "    \"brokerage\": [ { \"source\": \"email_pdf\"|string, \"snippet\": string, \"match\": string } ],\n"
+    "    \"complete_brokerage_address\": [ { \"source\": \"email_pdf\"|string, \"snippet\": string, \"match\": string } ],\n"
+    "    \"property_addresses\": [ { \"source\": \"email_pdf\"|string, \"snippet\": string, \"match\": string } ]\n"
+    "  },\n"
+    "  \"field_confidence\": {\n"
+    "    // Attach a confidence (0..1) and an explanation for why, per field\n"
+    "    \"broker_name\": { \"score\": number, \"explanation\": string },\n"
+    "    \"broker_email\": { \"score\": number, \"explanation\": string },\n"
+    "    \"brokerage\": { \"score\": number, \"explanation\": string },\n"
+    "    \"complete_brokerage_address\": { \"score\": number, \"explanation\": string },\n"
+    "    \"property_addresses\": { \"score\": number, \"explanation\": string, \"per_address\": [ { \"address\": string, \"score\": number, \"explanation\": string } ] }\n"
+    "  }\n"
+    "}\n"
+)
+_SCHEMA_FOOTER = "- Do not include commentary, only the JSON object."
+
+SCHEMA_DESCRIPTION_STRICT = _SCHEMA_BODY + _RULES_COMMON + _RULES_STRICT + _SCHEMA_FOOTER
+SCHEMA_DESCRIPTION_INFER = _SCHEMA_BODY + _RULES_COMMON + _RULES_INFER + _SCHEMA_FOOTER
+
+SYSTEM_PROMPT_STRICT = _BASE_INSTRUCTIONS + _STRICT_GUIDANCE + SCHEMA_DESCRIPTION_STRICT
+SYSTEM_PROMPT_INFER = _BASE_INSTRUCTIONS + _INFER_GUIDANCE + SCHEMA_DESCRIPTION_INFER
+
+
 def build_llm_context(email_text: str, attachments: List[Dict[str, Any]], guess_mode: bool) -> Dict[str, Any]:
     """Create instructions and prompt payload used for LLM extraction.
 
     Returns dict with keys: attachments_summary, system_instructions,
-    schema_description, user_prompt.
+    schema_description, user_prompt. The system prompt (instructions +
+    schema) is a precomposed constant; only the user payload varies.
     """
     attachments_summary = summarize_attachments_for_llm(attachments)
 
-    base_instructions = (
-        "Extract brokerage details and property addresses from the provided email thread text and attachment summaries. "
-        "Always return strictly valid JSON that conforms to the schema. No extra text.\n\n"
-        "Domain Context: The auto-ingest of insurance submission documents is a process that automates the current "
-        "manual process of reading insurance email submissions (and attachments) to extract relevant building attributes "
-        "of the properties requesting coverage such as construction class, occupancy type, number of stories, and others. "
-        "These attributes are necessary for running a catastrophe model and providing a quote. Every insurance submission is different; "
-        "each broker has their own document format and property data is often sparse, unstandardized, and unvetted. \n\n"
-        "Attachments may include tables or spreadsheets. Treat comma- or tab-separated rows and multi-line cells as structured records. "
-    )
-    strict_guidance = (
-        "Interpret fields semantically and prefer explicit mentions from the documents. "
-        "If information is missing entirely, return null rather than guessing.\n\n"
-    )
-    infer_guidance = (
-        "Interpret fields semantically and prefer explicit mentions. "
-        "If information appears implied but not explicitly stated, you may infer from context, "
-        "but reduce confidence and explain the inference clearly.\n\n"
-    )
-    system_instructions = base_instructions + (strict_guidance if not guess_mode else infer_guidance)
-
-    rules_common = (
-        "Rules:\n"
-        "- Use the email thread text and all attachment summaries\n"
-        "- Citations must be snippets that include the exact matched text plus surrounding context (120 characters on each side) from the provided texts (email thread or attachment previews).\n"
-        "- The \"source\" must be either \"email_pdf\" or the exact attachment filename provided.\n"
-        "- \"property_addresses\" must be a list of ALL property addresses found across the email and attachments.\n"
-        "- For each field, set \"field_confidence\" with a numeric score and a concise explanation for the score.\n"
-        "- In citations, set \"match\" equal to the exact text you used to identify the field (e.g., the broker name or address).\n"
-    )
-    rules_strict = "- If a field is not present explicitly, return null (and an empty citation list).\n"
-    rules_infer = (
-        "- If a field is not present explicitly, you may infer from context; "
-        "provide citations to the closest evidence, set a lower confidence, and explain the uncertainty.\n"
-    )
-    schema_description = (
-        "Return a JSON object with exactly these fields and types:\n"
-        "{\n"
-        "  \"broker_name\": string|null,\n"
-        "  \"broker_email\": string|null,\n"
-        "  \"brokerage\": string|null,\n"
-        "  \"complete_brokerage_address\": string|null,\n"
-        "  \"property_addresses\": [string],\n"
-        "  \"confidence_overall\": number,\n"
-        "  \"citations\": {\n"
-        "    // For each field above, provide an array of citations with source and a contextual snippet, plus the exact matched text\n"
-        "    \"broker_name\": [ { \"source\": \"email_pdf\"|string, \"snippet\": string, \"match\": string } ],\n"
-        "    \"broker_email\": [ { \"source\": \"email_pdf\"|string, \"snippet\": string, \"match\": string } ],\n"
-        "    \"brokerage\": [ { \"source\": \"email_pdf\"|string, \"snippet\": string, \"match\": string } ],\n"
-        "    \"complete_brokerage_address\": [ { \"source\": \"email_pdf\"|string, \"snippet\": string, \"match\": string } ],\n"
-        "    \"property_addresses\": [ { \"source\": \"email_pdf\"|string, \"snippet\": string, \"match\": string } ]\n"
-        "  },\n"
-        "  \"field_confidence\": {\n"
-        "    // Attach a confidence (0..1) and an explanation for why, per field\n"
-        "    \"broker_name\": { \"score\": number, \"explanation\": string },\n"
-        "    \"broker_email\": { \"score\": number, \"explanation\": string },\n"
-        "    \"brokerage\": { \"score\": number, \"explanation\": string },\n"
-        "    \"complete_brokerage_address\": { \"score\": number, \"explanation\": string },\n"
-        "    \"property_addresses\": { \"score\": number, \"explanation\": string, \"per_address\": [ { \"address\": string, \"score\": number, \"explanation\": string } ] }\n"
-        "  }\n"
-        "}\n" + rules_common + (rules_strict if not guess_mode else rules_infer) + "- Do not include commentary, only the JSON object."
-    )
+    system_instructions = SYSTEM_PROMPT_INFER if guess_mode else SYSTEM_PROMPT_STRICT
+    schema_description = SCHEMA_DESCRIPTION_INFER if guess_mode else SCHEMA_DESCRIPTION_STRICT
 
+    # Variable data only, so the static system prefix stays byte-identical
     user_prompt = {
         "email_thread_text": email_text,
         "attachments": attachments_summary,
-        "instructions": schema_description,
-        "options": {"guess_mode": bool(guess_mode)},
     }
 
     return {
@@ -273,6 +547,10 @@ def call_llm_for_structured_output(email_text: str, attachments: List[Dict[str,
     if not api_key:
         return {"status": "skipped", "reason": "missing_openai_key"}
 
+    # Cap prompt size: long threads add tokens (latency + cost) with little
+    # extraction value past the first ~20K chars
+    email_text = email_text[:MAX_EMAIL_CHARS]
+
     # Select model (override or default)
     used_model = (model or "").strip()
 
@@ -283,36 +561,73 @@ def call_llm_for_structured_output(email_text: str, attachments: List[Dict[str,
     schema_description = ctx["schema_description"]
     user_prompt = ctx["user_prompt"]
 
-    # Cache key derived from content + model + instructions to avoid duplicate calls
-    cache_key_payload = {
-        "email_thread_text": email_text,
-        "attachments": attachments_summary,
-        "model": used_model,
-        "instructions": schema_description,
-        "guess_mode": bool(guess_mode),
-    }
-    cache_key = hashlib.sha256(json.dumps(cache_key_payload, sort_keys=True).encode("utf-8")).hexdigest()
-
-    cached = LLM_CACHE.get(cache_key)
+    # Cache key derived from content + model + instructions to avoid duplicate
+    # calls. Fields stream straight into the hasher (with separator bytes so
+    # field boundaries stay unambiguous) instead of building a throwaway JSON
+    # blob first.
+    h = hashlib.blake2b(digest_size=16)
+    h.update(email_text.encode("utf-8"))
+    h.update(b"\x00")
+    for a in attachments_summary:
+        h.update((a.get("filename") or "").encode("utf-8"))
+        h.update(b"\x01")
+        h.update((a.get("mime_type") or "").encode("utf-8"))
+        h.update(b"\x01")
+        h.update(str(a.get("size_bytes") or 0).encode("utf-8"))
+        h.update(b"\x01")
+        h.update((a.get("text_preview") or "").encode("utf-8"))
+        h.update(b"\x02")
+    h.update(used_model.encode("utf-8"))
+    h.update(b"\x03")
+    h.update(schema_description.encode("utf-8"))
+    h.update(b"\x03")
+    h.update(b"1" if guess_mode else b"0")
+    cache_key = h.hexdigest()
+
+    cached = _llm_cache_get(cache_key)
+    if cached is None:
+        # Fall back to the shared on-disk cache (survives restarts/workers)
+        cached = _llm_disk_cache_get(cache_key)
+        if cached and cached.get("status") == "ok":
+            _llm_cache_set(cache_key, cached)
     if cached and cached.get("status") == "ok":
         # Mark cached result to help clients optionally identify hits
         result = dict(cached)
         result["cached"] = True
         return result
 
+    # Semantic lookup: match near-duplicate email threads with identical
+    # attachments/model/guess_mode by embedding similarity
+    semantic_vector: Optional[List[float]] = None
+    semantic_signature: Optional[str] = None
+    if SEMANTIC_CACHE_ENABLED:
+        semantic_signature = hashlib.sha256(json.dumps({
+            "attachments": attachments_summary,
+            "model": used_model,
+            "guess_mode": bool(guess_mode),
+        }, sort_keys=True).encode("utf-8")).hexdigest()
+        semantic_vector = _embed_email_text(_openai_client(), email_text)
+        if semantic_vector is not None:
+            hit = _semantic_cache_lookup(semantic_vector, semantic_signature)
+            if hit is not None:
+                result = dict(hit)
+                result["cached"] = True
+                result["cache_type"] = "semantic"
+                return result
+
     try:
         call_start_ms = _now_ms()
-        client = OpenAI()
+        client = _openai_client()
         # Some models (e.g., gpt-5) do not accept non-default temperature; omit it for those.
         create_args = {
             "model": used_model,
             "response_format": {"type": "json_object"},
             "messages": [
                 {"role": "system", "content": system_instructions},
-                {"role": "user", "content": json.dumps(user_prompt)},
+                {"role": "user", "content": orjson.dumps(user_prompt).decode()},
             ],
         }
-        if not str(used_model).lower().startswith("gpt-5"):
+        if not _is_gpt5_model(used_model):
             create_args["temperature"] = 0
 
         resp = client.chat.completions.create(**create_args)
@@ -323,10 +638,15 @@ def call_llm_for_structured_output(email_text: str, attachments: List[Dict[str,
         completion_tokens = getattr(usage, "completion_tokens", None) if usage else None
         total_tokens = getattr(usage, "total_tokens", None) if usage else None
         try:
-            parsed = json.loads(content)
+            parsed = orjson.loads(content)
         except Exception:
-            m = re.search(r"\{[\s\S]*\}", content)
-            parsed = json.loads(m.group(0)) if m else {"raw": content}
+            m = _JSON_OBJ_RE.search(content)
+            # Salvaged fragments may carry quirks orjson rejects; stdlib json
+            # is the lenient fallback
+            try:
+                parsed = json.loads(m.group(0)) if m else {"raw": content}
+            except Exception:
+                parsed = {"raw": content}
         latency_ms = _now_ms() - call_start_ms
         result = {"status": "ok", "model": used_model, "data": parsed, "latency_ms": latency_ms}
         if total_tokens is not None:
@@ -339,7 +659,10 @@ def call_llm_for_structured_output(email_text: str, attachments: List[Dict[str,
             cost = compute_cost_from_usage(result_usage)
             if cost:
                 result["cost"] = cost
-        LLM_CACHE[cache_key] = result
+        _llm_cache_set(cache_key, result)
+        _llm_disk_cache_set(cache_key, result)
+        if semantic_vector is not None and semantic_signature is not None:
+            _semantic_cache_store(semantic_vector, semantic_signature, result)
         return result
     except Exception as e:
         # Best-effort to include call latency on errors
@@ -353,37 +676,160 @@ def call_llm_for_structured_output(email_text: str, attachments: List[Dict[str,
         return err
 
 
+# Whitespace normalization for snippets, applied in one translate pass
+_NL_TABLE = str.maketrans({"\n": " ", "\r": " ", "\t": " "})
+
+
 def _make_snippet(text: str, start: int, end: int, context: int = 120) -> str:
     left = max(0, start - context)
     right = min(len(text), end + context)
-    snippet = text[left:right].replace("\n", " ")
+    snippet = text[left:right].translate(_NL_TABLE)
+    if left > 0 and right < len(text):
+        return f"…{snippet}…"
     if left > 0:
-        snippet = "…" + snippet
+        return f"…{snippet}"
     if right < len(text):
-        snippet = snippet + "…"
+        return f"{snippet}…"
     return snippet
 
 
+# Per-content cache of extracted PDF page text (original and lowercased) so
+# provenance search neither re-parses the same bytes nor re-folds the same
+# pages once per field/address term.
+_PDF_PAGES_CACHE: Dict[bytes, "tuple[List[str], List[str]]"] = {}
+_PDF_PAGES_CACHE_LOCK = threading.Lock()
+_PDF_PAGES_CACHE_MAX = 64
+
+
+def _pdf_pages_text(data: bytes) -> "tuple[List[str], List[str]]":
+    """Return (pages, pages_lower) for a PDF, parsing each distinct content at most once."""
+    key = hashlib.blake2b(data, digest_size=16).digest()
+    with _PDF_PAGES_CACHE_LOCK:
+        cached = _PDF_PAGES_CACHE.get(key)
+    if cached is not None:
+        return cached
+    pages: List[str] = []
+    try:
+        with pymupdf.open(stream=data, filetype="pdf") as doc:
+            for page in doc:
+                try:
+                    pages.append(page.get_text("text") or "")
+                except Exception:
+                    pages.append("")
+    except Exception:
+        pages = []
+    pages_lower = [p.lower() for p in pages]
+    with _PDF_PAGES_CACHE_LOCK:
+        if len(_PDF_PAGES_CACHE) >= _PDF_PAGES_CACHE_MAX:
+            _PDF_PAGES_CACHE.clear()
+        _PDF_PAGES_CACHE[key] = (pages, pages_lower)
+    return pages, pages_lower
+
+
 def find_in_pdf(data: bytes, term: str, max_hits: int = 1) -> List[Dict[str, Any]]:
     hits: List[Dict[str, Any]] = []
-    try:
-        reader = PdfReader(io.BytesIO(data))
-        lower_term = term.lower()
-        for idx, page in enumerate(reader.pages):
-            try:
-                txt = (page.extract_text() or "")
-            except Exception:
+    lower_term = term.lower()
+    pages, pages_lower = _pdf_pages_text(data)
+    for idx, lower_txt in enumerate(pages_lower):
+        if not lower_txt:
+            continue
+        pos = lower_txt.find(lower_term)
+        if pos != -1:
+            snippet = _make_snippet(pages[idx], pos, pos + len(term))
+            hits.append({"page": idx + 1, "snippet": snippet})
+            if len(hits) >= max_hits:
+                break
+    return hits
+
+
+def compute_provenance(
+    data_obj: Dict[str, Any],
+    email_pdf_bytes: bytes,
+    email_text: str,
+    attachment_raw: List[Dict[str, Any]],
+) -> Dict[str, List[Dict[str, Any]]]:
+    """Locate extracted field values in the source documents.
+
+    All field values and property addresses are compiled into a single
+    Aho-Corasick automaton, so each document text is scanned exactly once
+    regardless of how many terms need locating (vs. one linear pass per
+    term per page).
+    """
+    terms: List[tuple] = []
+    for field in ("broker_name", "broker_email", "brokerage", "complete_brokerage_address"):
+        val = data_obj.get(field)
+        if isinstance(val, str) and val.strip():
+            terms.append((field, val.strip()))
+    addresses = data_obj.get("property_addresses")
+    if isinstance(addresses, list):
+        for addr in addresses:
+            if isinstance(addr, str) and addr.strip():
+                terms.append(("property_addresses", addr.strip()))
+    if not terms:
+        return {}
+
+    # Identical values shared by several fields (e.g. broker_name repeated in
+    # brokerage, duplicate addresses) collapse to one automaton word whose
+    # payload lists every owning field, so each is searched exactly once
+    owners_by_word: Dict[str, List[tuple]] = {}
+    for field, term in terms:
+        owners_by_word.setdefault(term.lower(), []).append((field, term))
+
+    automaton = ahocorasick.Automaton()
+    for word, owners in owners_by_word.items():
+        automaton.add_word(word, owners)
+    automaton.make_automaton()
+
+    provenance: Dict[str, List[Dict[str, Any]]] = {}
+    seen: set = set()
+
+    def _scan(doc_name: str, page: Optional[int], text: str, lower_txt: Optional[str] = None) -> None:
+        if not text:
+            return
+        if lower_txt is None:
+            lower_txt = text.lower()
+        for end_idx, owners in automaton.iter(lower_txt):
+            for field, term in owners:
+                key = (field, term, doc_name)
+                if key in seen:
+                    continue
+                seen.add(key)
+                start = end_idx - len(term) + 1
+                provenance.setdefault(field, []).append({
+                    "doc": doc_name,
+                    "page": page,
+                    "snippet": _make_snippet(text, start, end_idx + 1),
+                    "match": term,
+                })
+
+    email_pages, email_pages_lower = _pdf_pages_text(email_pdf_bytes) if email_pdf_bytes else ([], [])
+    if email_pages:
+        for idx, page_text in enumerate(email_pages):
+            _scan("email_pdf", idx + 1, page_text, email_pages_lower[idx])
+    else:
+        # Non-PDF email uploads fall back to the extracted text preview
+        _scan("email_pdf", None, email_text)
+
+    scanned_contents: set = set()
+    for ar in attachment_raw:
+        # Identical attachment contents need only one scan; cite the first name
+        content_hash = ar.get("content_hash")
+        if content_hash:
+            if content_hash in scanned_contents:
                 continue
-            lower_txt = txt.lower()
-            pos = lower_txt.find(lower_term)
-            if pos != -1:
-                snippet = _make_snippet(txt, pos, pos + len(term))
-                hits.append({"page": idx + 1, "snippet": snippet})
-                if len(hits) >= max_hits:
-                    break
-        return hits
-    except Exception:
-        return hits
+            scanned_contents.add(content_hash)
+        filename = ar.get("filename") or ""
+        mimetype = (ar.get("mimetype") or "").lower()
+        if mimetype == "application/pdf" or filename.lower().endswith(".pdf"):
+            # PDF attachments get page-level citations from the cached parse
+            # (full document, not just the truncated preview)
+            att_pages, att_pages_lower = _pdf_pages_text(ar.get("data") or b"")
+            for idx, page_text in enumerate(att_pages):
+                _scan(filename, idx + 1, page_text, att_pages_lower[idx])
+        else:
+            _scan(filename, None, ar.get("text_preview") or "")
+
+    return provenance
 
 
 def find_in_text(text: str, term: str) -> Optional[str]:
@@ -399,6 +845,55 @@ def health() -> Any:
     return jsonify({"status": "ok"})
 
 
+@app.post("/admin/cache/clear")
+def clear_caches() -> Any:
+    """Drop all in-process caches (LLM results, semantic vectors, parsed docs).
+
+    Requires ADMIN_TOKEN to be configured and presented via the
+    X-Admin-Token header; with no token configured the endpoint is
+    disabled and indistinguishable from a missing route.
+    """
+    admin_token = os.environ.get("ADMIN_TOKEN", "").strip()
+    if not admin_token:
+        return jsonify({"error": "Not found"}), 404
+    if request.headers.get("X-Admin-Token", "") != admin_token:
+        return jsonify({"error": "Forbidden"}), 403
+    with LLM_CACHE_LOCK:
+        llm_entries = len(LLM_CACHE)
+        LLM_CACHE.clear()
+    with _SEMANTIC_CACHE_LOCK:
+        semantic_entries = len(_SEMANTIC_CACHE)
+        _SEMANTIC_CACHE.clear()
+    with _DOC_TEXT_CACHE_LOCK:
+        doc_entries = len(_DOC_TEXT_CACHE)
+        _DOC_TEXT_CACHE.clear()
+    with _PDF_PAGES_CACHE_LOCK:
+        pdf_entries = len(_PDF_PAGES_CACHE)
+        _PDF_PAGES_CACHE.clear()
+    return jsonify({
+        "status": "ok",
+        "cleared": {
+            "llm": llm_entries,
+            "semantic": semantic_entries,
+            "doc_text": doc_entries,
+            "pdf_pages": pdf_entries,
+        },
+    })
+
+
+@app.errorhandler(413)
+def payload_too_large(e: Any) -> Any:
+    _json_log("WARNING", {
+        "event": "validation_error",
+        "request_id": str(uuid.uuid4()),
+        "route": request.path,
+        "error_category": "validation",
+        "reason": "payload_too_large",
+        "max_upload_mb": MAX_UPLOAD_MB,
+    })
+    return jsonify({"error": f"Payload too large (limit {MAX_UPLOAD_MB} MB)"}), 413
+
+
 @app.post("/api/upload")
 def upload() -> Any:
     request_id = str(uuid.uuid4())
@@ -434,37 +929,61 @@ def upload() -> Any:
         })
         return jsonify({"error": "Missing 'email_pdf' file"}), 400
 
-    # Process email PDF
+    # Process email PDF (single read; nothing reuses the stream afterwards)
     email_data = email_pdf.read() or b""
-    try:
-        email_pdf.seek(0)
-    except Exception:
-        pass
-
-    email_meta = structure_document_json(email_pdf.filename or "", email_pdf.mimetype or "", email_data)
-    email_text = email_meta.get("text_preview", "")
 
-    # Process attachments
-    attachments: List[Dict[str, Any]] = []
-    # Keep raw data for provenance search (not returned to client)
-    attachment_raw: List[Dict[str, Any]] = []
+    # Process attachments: read all bytes first (fast), then parse in parallel
+    # since PDF/XLSX extraction is the main CPU/IO cost per file.
+    attachment_inputs: List[Dict[str, Any]] = []
     for f in attachments_files:
         data = f.read() or b""
-        try:
-            f.seek(0)
-        except Exception:
-            pass
-        meta = structure_document_json(f.filename or "", f.mimetype or "", data)
-        attachments.append(meta)
-        attachment_raw.append({
+        attachment_inputs.append({
             "filename": f.filename or "",
             "mimetype": f.mimetype or "",
             "data": data,
-            "text_preview": meta.get("text_preview", ""),
+            "content_hash": hashlib.blake2b(data, digest_size=16).hexdigest(),
         })
 
-    # Compute a source hash from email + attachments bytes (no PII logged)
-    h = hashlib.sha256()
+    attachments: List[Dict[str, Any]] = []
+    # Keep raw data for provenance search (not returned to client)
+    attachment_raw: List[Dict[str, Any]] = []
+    if attachment_inputs:
+        # Parse the email PDF on the same pool so it overlaps the attachments
+        with ThreadPoolExecutor(max_workers=min(MAX_PARSE_WORKERS, 1 + len(attachment_inputs))) as ex:
+            email_future = ex.submit(
+                structure_document_json, email_pdf.filename or "", email_pdf.mimetype or "", email_data
+            )
+            metas = list(ex.map(
+                lambda a: structure_document_json(a["filename"], a["mimetype"], a["data"]),
+                attachment_inputs,
+            ))
+            email_meta = email_future.result()
+        for a, meta in zip(attachment_inputs, metas):
+            attachments.append(meta)
+            attachment_raw.append({
+                "filename": a["filename"],
+                "mimetype": a["mimetype"],
+                "data": a["data"],
+                "content_hash": a["content_hash"],
+                "text_preview": meta.get("text_preview", ""),
+            })
+    else:
+        email_meta = structure_document_json(email_pdf.filename or "", email_pdf.mimetype or "", email_data)
+    email_text = email_meta.get("text_preview", "")
+
+    # Duplicate attachments (same bytes CCed under one or more names) add
+    # prompt tokens without adding information; send each content once
+    llm_attachments: List[Dict[str, Any]] = []
+    seen_attachment_hashes: set = set()
+    for a, meta in zip(attachment_inputs, attachments):
+        if a["content_hash"] in seen_attachment_hashes:
+            continue
+        seen_attachment_hashes.add(a["content_hash"])
+        llm_attachments.append(meta)
+
+    # Compute a source hash from email + attachments bytes (no PII logged);
+    # blake2b since this only needs to identify inputs, not be cryptographic
+    h = hashlib.blake2b(digest_size=16)
     h.update(email_data)
     for ar in attachment_raw:
         h.update(ar.get("data", b""))
@@ -472,7 +991,7 @@ def upload() -> Any:
 
     # Call LLM for structured JSON
     llm_start = _now_ms()
-    llm = call_llm_for_structured_output(email_text=email_text, attachments=attachments, guess_mode=guess_mode, model=requested_model or None)
+    llm = call_llm_for_structured_output(email_text=email_text, attachments=llm_attachments, guess_mode=guess_mode, model=requested_model or None)
     llm_latency_ms = (llm.get("latency_ms") if isinstance(llm, dict) and llm.get("latency_ms") is not None else (_now_ms() - llm_start))
 
     provenance: Dict[str, List[Dict[str, Any]]] = {}
@@ -500,7 +1019,23 @@ def upload() -> Any:
                             entry["match"] = match
                         provenance.setdefault(field, []).append(entry)
 
-                    
+        # Fall back to searching the documents only when some extracted field
+        # is missing citations; with the schema demanding citations per field,
+        # the common case has them all and skips the scan entirely
+        needs_fallback = False
+        if PROVENANCE_ENABLED and isinstance(data_obj, dict):
+            for field in ("broker_name", "broker_email", "brokerage", "complete_brokerage_address", "property_addresses"):
+                val = data_obj.get(field)
+                has_value = bool(val.strip()) if isinstance(val, str) else bool(val)
+                if has_value and not provenance.get(field):
+                    needs_fallback = True
+                    break
+        if needs_fallback:
+            fallback = compute_provenance(data_obj, email_data, email_text, attachment_raw)
+            for field, entries in fallback.items():
+                if not provenance.get(field):
+                    provenance[field] = entries
+
     elif llm.get("status") == "error":
         # Categorize provider errors
         msg = (llm.get("message") or "").lower()
@@ -552,9 +1087,19 @@ def upload() -> Any:
         "elapsed_ms": _now_ms() - req_start,
     })
 
-    return jsonify(result), status_code
+    # orjson serializes the (potentially 100+ KB) result several times faster
+    # than jsonify's stdlib encoder
+    return app.response_class(orjson.dumps(result), mimetype="application/json"), status_code
 
 
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", "5000"))
-    app.run(host="0.0.0.0", port=port, debug=True)
+    if os.environ.get("FLASK_DEBUG", "").strip().lower() in ("1", "true", "yes", "on"):
+        # Dev-only: werkzeug reloader/debugger, serialized requests
+        app.run(host="0.0.0.0", port=port, debug=True)
+    else:
+        # Threaded production server: requests waiting on the LLM round-trip
+        # no longer block each other
+        from waitress import serve
+
+        serve(app, host="0.0.0.0", port=port, threads=int(os.environ.get("WAITRESS_THREADS", "32")))
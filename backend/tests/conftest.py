@@ -2,6 +2,12 @@ import os
 import sys
 import pathlib
 import pytest
+from flask.json.provider import JSONProvider
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is in requirements.txt
+    orjson = None
 
 # Ensure backend directory is on sys.path for reliable imports
 _HERE = pathlib.Path(__file__).resolve().parent
@@ -17,10 +23,53 @@ def clear_env(monkeypatch):
     yield
 
 
+@pytest.fixture(autouse=True)
+def isolate_llm_caches(monkeypatch):
+    # Disable the on-disk LLM cache and empty the in-memory one so no test is
+    # served a stale result from a prior run. LLM_CACHE_DIR is read into a
+    # module constant at import, so the constant (not the env var) is patched.
+    import app as app_module
+
+    monkeypatch.setattr(app_module, "LLM_CACHE_DIR", "")
+    with app_module.LLM_CACHE_LOCK:
+        app_module.LLM_CACHE.clear()
+    yield
+    with app_module.LLM_CACHE_LOCK:
+        app_module.LLM_CACHE.clear()
+
+
+@pytest.fixture(autouse=True)
+def reset_openai_client():
+    # The app memoizes its OpenAI client; reset it so each test's patched
+    # OpenAI constructor takes effect
+    import app as app_module
+
+    app_module._OPENAI_CLIENT = None
+    yield
+    app_module._OPENAI_CLIENT = None
+
+
+class _OrjsonProvider(JSONProvider):
+    # Speeds up resp.get_json() in assertions; the app already serializes
+    # responses with orjson directly, so this only affects the test client
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj).decode("utf-8")
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+
 @pytest.fixture()
 def app():
     from app import app as flask_app
-    return flask_app
+
+    if orjson is not None:
+        original = flask_app.json
+        flask_app.json = _OrjsonProvider(flask_app)
+        yield flask_app
+        flask_app.json = original
+    else:
+        yield flask_app
 
 
 @pytest.fixture()
@@ -1,179 +1,300 @@
-import io
+from __future__ import annotations
+
 import json
-from typing import Any
+from dataclasses import dataclass
+from types import MappingProxyType, SimpleNamespace
+
+import pytest
+
+import app as app_module
+
+try:
+    import orjson
 
+    def _dumps(obj) -> str:
+        return orjson.dumps(obj).decode("utf-8")
+except ImportError:  # CI without orjson falls back to stdlib
+    def _dumps(obj) -> str:
+        return json.dumps(obj)
 
+
+# Deterministic LLM payload shared by the tests; serialized once at import so
+# repeated mock calls skip the JSON encode entirely. Wrapped read-only so
+# nothing mutates it between tests.
+_LLM_PAYLOAD = MappingProxyType({
+    "broker_name": "John Smith",
+    "broker_email": "john.smith@acmebrokerage.com",
+    "brokerage": "Acme Brokerage",
+    "complete_brokerage_address": "123 Broad St, Floor 5, New York, NY 10001",
+    "property_addresses": [
+        "10 Market St, San Francisco, CA 94103",
+        "25 Pine Ave, Miami, FL 33101",
+    ],
+    "confidence_overall": 0.82,
+    "citations": {
+        "broker_name": [
+            {
+                "source": "email_pdf",
+                "snippet": "...Regards, John Smith — Acme Brokerage...",
+                "match": "John Smith",
+            }
+        ],
+        "broker_email": [
+            {
+                "source": "email_pdf",
+                "snippet": "...contact me at john.smith@acmebrokerage.com for details...",
+                "match": "john.smith@acmebrokerage.com",
+            }
+        ],
+        "brokerage": [
+            {
+                "source": "email_pdf",
+                "snippet": "...John Smith, Acme Brokerage, 123 Broad St...",
+                "match": "Acme Brokerage",
+            }
+        ],
+        "complete_brokerage_address": [
+            {
+                "source": "email_pdf",
+                "snippet": "...Acme Brokerage, 123 Broad St, Floor 5, New York, NY 10001...",
+                "match": "123 Broad St, Floor 5, New York, NY 10001",
+            }
+        ],
+        "property_addresses": [
+            {
+                "source": "properties.csv",
+                "snippet": "...10 Market St, San Francisco, CA 94103, wood frame...",
+                "match": "10 Market St, San Francisco, CA 94103",
+            },
+            {
+                "source": "properties.csv",
+                "snippet": "...25 Pine Ave, Miami, FL 33101, masonry...",
+                "match": "25 Pine Ave, Miami, FL 33101",
+            },
+        ],
+    },
+    "field_confidence": {
+        "broker_name": {"score": 0.9, "explanation": "Signature line contains full name."},
+        "broker_email": {"score": 0.95, "explanation": "Explicit email provided."},
+        "brokerage": {"score": 0.85, "explanation": "Appears next to name in signature."},
+        "complete_brokerage_address": {"score": 0.8, "explanation": "Full address listed."},
+        "property_addresses": {
+            "score": 0.75,
+            "explanation": "Addresses present in attachment rows.",
+            "per_address": [
+                {"address": "10 Market St, San Francisco, CA 94103", "score": 0.78, "explanation": "Found in properties.csv."},
+                {"address": "25 Pine Ave, Miami, FL 33101", "score": 0.72, "explanation": "Found in properties.csv."},
+            ],
+        },
+    },
+})
+_LLM_PAYLOAD_JSON = _dumps(dict(_LLM_PAYLOAD))
+
+
+@dataclass(slots=True)
 class _Msg:
-    def __init__(self, content: str):
-        self.content = content
+    content: str
 
 
+@dataclass(slots=True)
 class _Choice:
-    def __init__(self, content: str):
-        self.message = _Msg(content)
+    message: _Msg
 
 
 class _Resp:
-    def __init__(self, payload: dict):
-        content = json.dumps(payload)
-        self.choices = [_Choice(content)]
+    __slots__ = ("choices",)
+
+    def __init__(self, payload: dict | str):
+        # Pre-serialized payloads pass through without a re-encode
+        content = payload if isinstance(payload, str) else _dumps(payload)
+        self.choices = [_Choice(_Msg(content))]
 
 
 class _ChatCompletions:
-    def __init__(self, payload: dict | Exception):
-        self._payload_or_exc = payload
+    def __init__(self, payload: dict | str | Exception):
+        # Decide success vs failure once at construction; create() is then a
+        # plain attribute call with no per-invocation isinstance branch
+        if isinstance(payload, Exception):
+            def create(*args, **kwargs):
+                raise payload
+        else:
+            resp = _Resp(payload)
 
-    def create(self, *args: Any, **kwargs: Any):
-        if isinstance(self._payload_or_exc, Exception):
-            raise self._payload_or_exc
-        return _Resp(self._payload_or_exc)
+            def create(*args, **kwargs):
+                return resp
+        self.create = create
 
 
-class _Chat:
-    def __init__(self, payload: dict | Exception):
-        self.completions = _ChatCompletions(payload)
+class _DummyOpenAI:
+    def __init__(self, payload: dict | str | Exception):
+        # SimpleNamespace stands in for the SDK's intermediate chat object
+        self.chat = SimpleNamespace(completions=_ChatCompletions(payload))
 
 
-class _DummyOpenAI:
-    def __init__(self, payload: dict | Exception):
-        self.chat = _Chat(payload)
+_BOUNDARY = "----resiquant-test-boundary"
 
+_EMAIL_TEXT = (
+    b"Subject: Property Submission\n"
+    b"Hello,\nPlease see the attached properties for quote.\n"
+    b"Regards, John Smith\nAcme Brokerage\n"
+    b"Contact: john.smith@acmebrokerage.com\n"
+)
+# Attachment as CSV-ish text so preview includes addresses
+_PROP_CSV = (
+    b"address,construction\n"
+    b"10 Market St, San Francisco, CA 94103,wood\n"
+    b"25 Pine Ave, Miami, FL 33101,masonry\n"
+)
 
-def _multipart_file(data: bytes, filename: str, mimetype: str):
-    return (io.BytesIO(data), filename, mimetype)
 
+def _encode_multipart(files, boundary: str = _BOUNDARY):
+    """Encode (field, filename, mimetype, data) tuples into one multipart body.
 
-def test_upload_llm_mock_success(client, monkeypatch):
-    # Arrange a deterministic LLM response with citations
-    llm_payload = {
-        "broker_name": "John Smith",
-        "broker_email": "john.smith@acmebrokerage.com",
-        "brokerage": "Acme Brokerage",
-        "complete_brokerage_address": "123 Broad St, Floor 5, New York, NY 10001",
-        "property_addresses": [
-            "10 Market St, San Francisco, CA 94103",
-            "25 Pine Ave, Miami, FL 33101",
-        ],
-        "confidence_overall": 0.82,
-        "citations": {
-            "broker_name": [
-                {
-                    "source": "email_pdf",
-                    "snippet": "...Regards, John Smith — Acme Brokerage...",
-                    "match": "John Smith",
-                }
-            ],
-            "broker_email": [
-                {
-                    "source": "email_pdf",
-                    "snippet": "...contact me at john.smith@acmebrokerage.com for details...",
-                    "match": "john.smith@acmebrokerage.com",
-                }
-            ],
-            "brokerage": [
-                {
-                    "source": "email_pdf",
-                    "snippet": "...John Smith, Acme Brokerage, 123 Broad St...",
-                    "match": "Acme Brokerage",
-                }
-            ],
-            "complete_brokerage_address": [
-                {
-                    "source": "email_pdf",
-                    "snippet": "...Acme Brokerage, 123 Broad St, Floor 5, New York, NY 10001...",
-                    "match": "123 Broad St, Floor 5, New York, NY 10001",
-                }
-            ],
-            "property_addresses": [
-                {
-                    "source": "properties.csv",
-                    "snippet": "...10 Market St, San Francisco, CA 94103, wood frame...",
-                    "match": "10 Market St, San Francisco, CA 94103",
-                },
-                {
-                    "source": "properties.csv",
-                    "snippet": "...25 Pine Ave, Miami, FL 33101, masonry...",
-                    "match": "25 Pine Ave, Miami, FL 33101",
-                },
-            ],
-        },
-        "field_confidence": {
-            "broker_name": {"score": 0.9, "explanation": "Signature line contains full name."},
-            "broker_email": {"score": 0.95, "explanation": "Explicit email provided."},
-            "brokerage": {"score": 0.85, "explanation": "Appears next to name in signature."},
-            "complete_brokerage_address": {"score": 0.8, "explanation": "Full address listed."},
-            "property_addresses": {
-                "score": 0.75,
-                "explanation": "Addresses present in attachment rows.",
-                "per_address": [
-                    {"address": "10 Market St, San Francisco, CA 94103", "score": 0.78, "explanation": "Found in properties.csv."},
-                    {"address": "25 Pine Ave, Miami, FL 33101", "score": 0.72, "explanation": "Found in properties.csv."},
-                ],
-            },
-        },
-    }
+    Built once at import into a bytearray (amortized O(1) append) so the
+    tests post a ready-made body instead of re-encoding per request.
+    """
+    buf = bytearray()
+    for field, filename, mimetype, data in files:
+        buf += f"--{boundary}\r\n".encode()
+        buf += f'Content-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'.encode()
+        buf += f"Content-Type: {mimetype}\r\n\r\n".encode()
+        buf += data
+        buf += b"\r\n"
+    buf += f"--{boundary}--\r\n".encode()
+    return bytes(buf), f"multipart/form-data; boundary={boundary}"
 
-    import app as app_module
 
-    # Patch the OpenAI constructor used inside the module to return our dummy
-    monkeypatch.setattr(app_module, "OpenAI", lambda: _DummyOpenAI(llm_payload))
-
-    # Build a minimal multipart request
-    email_text = (
-        b"Subject: Property Submission\n"
-        b"Hello,\nPlease see the attached properties for quote.\n"
-        b"Regards, John Smith\nAcme Brokerage\n"
-        b"Contact: john.smith@acmebrokerage.com\n"
-    )
-    email_file = _multipart_file(email_text, "email.txt", "text/plain")
+@pytest.fixture(scope="module")
+def dummy_openai_success():
+    # Built once per module; the monkeypatch itself stays per-test
+    return _DummyOpenAI(_LLM_PAYLOAD_JSON)
 
-    # Attachment as CSV-ish text so preview includes addresses
-    prop_csv = (
-        b"address,construction\n"
-        b"10 Market St, San Francisco, CA 94103,wood\n"
-        b"25 Pine Ave, Miami, FL 33101,masonry\n"
-    )
-    props_file = _multipart_file(prop_csv, "properties.csv", "text/csv")
 
-    data = {
-        "email_pdf": email_file,
-        "attachments": [props_file],
-    }
+@pytest.fixture(scope="module")
+def dummy_openai_error():
+    return _DummyOpenAI(RuntimeError("provider down"))
+
+
+_SUCCESS_BODY, _SUCCESS_CONTENT_TYPE = _encode_multipart([
+    ("email_pdf", "email.txt", "text/plain", _EMAIL_TEXT),
+    ("attachments", "properties.csv", "text/csv", _PROP_CSV),
+])
+_ERROR_BODY, _ERROR_CONTENT_TYPE = _encode_multipart([
+    ("email_pdf", "email.txt", "text/plain", b"Test email body"),
+])
+
+# Expected subset of the success response; one structured check instead of a
+# run of individual lookups
+_EXPECTED_SUCCESS = {
+    "llm_parsed": {"status": "ok", "data": {"broker_name": "John Smith"}},
+    "email_document": {"filename": "email.txt"},
+    "document_count": 2,
+}
 
-    resp = client.post("/api/upload", data=data, content_type="multipart/form-data")
+
+def _assert_subset(expected, actual, path="body"):
+    """Assert every leaf in `expected` matches `actual`, reporting the path."""
+    if isinstance(expected, dict):
+        for key, value in expected.items():
+            assert key in actual, f"{path}[{key!r}] missing"
+            _assert_subset(value, actual[key], f"{path}[{key!r}]")
+    else:
+        assert actual == expected, f"{path}: {actual!r} != {expected!r}"
+
+
+def test_upload_llm_mock_success(client, monkeypatch, dummy_openai_success):
+    # Patch the OpenAI constructor used inside the module to return our dummy
+    # (pre-serialized payload: no JSON encode per mocked call)
+    monkeypatch.setattr(app_module, "OpenAI", lambda: dummy_openai_success)
+
+    resp = client.post("/api/upload", data=_SUCCESS_BODY, content_type=_SUCCESS_CONTENT_TYPE)
     assert resp.status_code == 200
 
     body = resp.get_json()
-    assert body["llm_parsed"]["status"] == "ok"
-    assert body["llm_parsed"]["data"]["broker_name"] == "John Smith"
-    assert body["email_document"]["filename"] == "email.txt"
-    assert body["document_count"] == 2
+    _assert_subset(_EXPECTED_SUCCESS, body)
 
     # Provenance should mirror the LLM citations (preferred path)
     prov = body["provenance"]
     assert "broker_name" in prov and prov["broker_name"][0]["doc"] == "email_pdf"
-    assert all(entry.get("page") is None for entries in prov.values() for entry in entries)
+    # Per-entry loop so a failure pinpoints the offending entry
+    for entries in prov.values():
+        for entry in entries:
+            assert entry.get("page") is None, entry
     assert any(e.get("doc") == "properties.csv" for e in prov["property_addresses"])  # from attachment
 
 
-def test_upload_llm_mock_error_path(client, monkeypatch):
+def test_upload_llm_mock_error_path(client, monkeypatch, dummy_openai_error):
     # Simulate OpenAI SDK raising an exception
-    exc = RuntimeError("provider down")
-    import app as app_module
-    monkeypatch.setattr(app_module, "OpenAI", lambda: _DummyOpenAI(exc))
+    monkeypatch.setattr(app_module, "OpenAI", lambda: dummy_openai_error)
 
-    email_file = _multipart_file(b"Test email body", "email.txt", "text/plain")
-    resp = client.post(
-        "/api/upload",
-        data={"email_pdf": email_file},
-        content_type="multipart/form-data",
-    )
+    resp = client.post("/api/upload", data=_ERROR_BODY, content_type=_ERROR_CONTENT_TYPE)
     assert resp.status_code == 200
     body = resp.get_json()
     assert body["llm_parsed"]["status"] == "error"
     assert "message" in body["llm_parsed"]
 
 
+def _make_pdf(pages):
+    """Build a small in-memory PDF with one text block per page."""
+    import pymupdf
+
+    doc = pymupdf.open()
+    for text in pages:
+        page = doc.new_page()
+        page.insert_text((72, 72), text)
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+# Payload with no citations key, forcing the Aho-Corasick document-search
+# fallback to build provenance
+_LLM_PAYLOAD_NO_CITATIONS = MappingProxyType({
+    "broker_name": "John Smith",
+    "broker_email": None,
+    "brokerage": None,
+    "complete_brokerage_address": None,
+    "property_addresses": ["10 Market St, San Francisco, CA 94103"],
+    "confidence_overall": 0.5,
+})
+
+
+def test_upload_provenance_search_fallback(client, monkeypatch):
+    monkeypatch.setattr(
+        app_module, "OpenAI", lambda: _DummyOpenAI(dict(_LLM_PAYLOAD_NO_CITATIONS))
+    )
+
+    # Address appears on page 2 of the PDF attachment so a page-level hit
+    # proves the per-page scan, not just a whole-document match
+    pdf_data = _make_pdf([
+        "Schedule of values, page one.",
+        "Location: 10 Market St, San Francisco, CA 94103 (wood frame)",
+    ])
+    body, content_type = _encode_multipart([
+        ("email_pdf", "email.txt", "text/plain", _EMAIL_TEXT),
+        ("attachments", "properties.pdf", "application/pdf", pdf_data),
+    ])
+
+    resp = client.post("/api/upload", data=body, content_type=content_type)
+    assert resp.status_code == 200
+    body_json = resp.get_json()
+    assert body_json["llm_parsed"]["status"] == "ok"
+
+    prov = body_json["provenance"]
+    # Broker name is found in the (non-PDF) email text: no page number
+    assert prov["broker_name"][0]["doc"] == "email_pdf"
+    assert prov["broker_name"][0]["page"] is None
+    assert "John Smith" in prov["broker_name"][0]["snippet"]
+    # Address is found in the PDF attachment with a page-level citation
+    addr_hits = prov["property_addresses"]
+    assert any(
+        e["doc"] == "properties.pdf"
+        and e["page"] == 2
+        and e.get("match") == "10 Market St, San Francisco, CA 94103"
+        for e in addr_hits
+    ), addr_hits
+
+
 def test_upload_missing_email_pdf(client):
     resp = client.post(
         "/api/upload",